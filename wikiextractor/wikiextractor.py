@@ -42,16 +42,23 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # =============================================================================
 
+import argparse
+import functools
 import io
+import itertools
 import sys
-import getopt
 import urllib
 import re
 import bz2
 import os.path
-import ujson
+import orjson
 import urllib.parse
-from multiprocessing import Pool
+import zstandard
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
 
 """Wikipedia Extractor:
 Extracts and cleans text from Wikipedia database dump and stores output in a
@@ -59,28 +66,49 @@ number of files of similar size in a given directory. In each line of these file
 a wikipedia page is stored in JSON format.
 
 Usage:
+  python wikiextractor.py [options] [your_wikipedia_dump.xml.bz2]
   python wikiextractor.py [options] < your_wikipedia_dump.xml
 
+When the dump is given as a file ending in .bz2 and the optional
+indexed_bzip2 package is installed, the bz2 blocks are decompressed in
+parallel on all cores; otherwise the file is read single-threaded.
+
 Options:
-  -c, --compress        : compress output files using bzip2 algorithm
-  -b ..., --bytes=...   : put specified bytes per output file (500K by default)
+  -c, --compress        : compress output files (zstd by default)
+  --format=...          : compression format for -c, 'zst' or 'bz2'
+                          (zstd compresses several times faster at a
+                          comparable ratio and uses all cores; bz2 is
+                          kept for consumers that expect .bz2 files)
+  -b ..., --bytes=...   : put specified bytes per output file (64M by
+                          default; the k, m and g suffixes are accepted);
+                          with -c the limit is scaled by the
+                          observed compression ratio, so it approximates
+                          the size of each file on disk
+  --target-compressed-bytes=... : roll output files over when the bytes
+                          actually on disk reach this size, instead of
+                          counting uncompressed bytes (useful with -c)
   -o ..., --output=...  : place output files in specified directory (current
                           directory by default)
-  --help                : display this help and exit
-  --usage               : display script usage
-  -w ..., --workers=... : use specified number of workers
+  -h, --help            : display this help and exit
+  -w ..., --workers=... : use specified number of workers (all cores by default)
+  --batch-size=...      : number of pages shipped to a worker per task
+                          (64 by default)
   -p ..., --prefix=...  : use specified url prefix (default is 'http://en.wikipedia.org/wiki/')
 """
 
 
 ### SUPPORT CLASSES ###########################################################
 
-class AnnotatedWikiDocument(dict):
-    __slots__ = ['default', 'id', 'url', "title", 'text', 'annotations', 'categories', 'disambiguation']
+# Tipi di risultato prodotti da process_page, usati come indici nella tabella
+# dei gestori di OutputSplitter.write
+ARTICLE, REDIRECT, CATEGORY_PAGE = 0, 1, 2
+
+class AnnotatedWikiDocument:
+    # su una sottoclasse di dict gli slot non eliminavano il __dict__; senza
+    # la base dict ogni istanza si riduce ai soli slot dichiarati
+    __slots__ = ['id', 'url', 'title', 'text', 'annotations', 'categories', 'disambiguation']
 
-    def __init__(self, default=None, **kwargs):
-        super(AnnotatedWikiDocument, self).__init__(**kwargs)
-        self.default = default
+    def __init__(self):
         self.id = None
         self.url = None
         self.title = None
@@ -89,29 +117,30 @@ class AnnotatedWikiDocument(dict):
         self.categories = set()
         self.disambiguation = False
 
+    def to_bytes(self):
+        return orjson.dumps({
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "text": self.text,
+            "annotations": self.annotations,
+            "categories": list(self.categories),
+            "disambiguation": self.disambiguation,
+        }, option=orjson.OPT_APPEND_NEWLINE)
+
 
-    def __str__(self):
-        self["id"] = self.id
-        self["url"] = self.url
-        self["title"] = self.title
-        self["text"] = self.text
-        self["annotations"] = self.annotations
-        self["categories"] = self.categories
-        self["disambiguation"] = self.disambiguation
-        return ujson.dumps(self) + "\n"
+_SPACE_UNDERSCORE = str.maketrans({' ': '_'})
 
 
+@functools.lru_cache(maxsize=65536)
 def get_wiki_document_url(wiki_document_title, prefix, quote=False):
+    # popular articles are linked thousands of times, so the cache turns most
+    # calls into a plain dict hit
+    title = wiki_document_title.translate(_SPACE_UNDERSCORE)
     if quote:
-        title = urllib.parse.quote(wiki_document_title.replace(' ', '_').encode('utf-8'))
-        title = title.replace('%28', '(')
-        title = title.replace('%29', ')')
-        title = title.replace('%3A', ':')
-        title = title.replace('%22', '"')
-        title = title.replace('%27', "'")
-    else:
-        title = wiki_document_title.replace(' ', '_')
-
+        # the extra safe characters keep (, ), :, " and ' literal, which used
+        # to be restored with five replace passes after quoting
+        title = urllib.parse.quote(title.encode('utf-8'), safe="/()\"':")
     return prefix + title[0].upper() + title[1:]
 
 
@@ -212,34 +241,25 @@ class AnnotatedWikiExtractor(object):
         self.drop_indents = drop_indents
         self.keep_anchors = keep_anchors
 
-        # Riconosce i commenti HTML
-        self.__comment_pattern = re.compile(r'<!--.*?-->', re.DOTALL)
-
-        # Riconosce i tag HTML spazzatura
-        self.__garbage_tag_patterns = list()
-        for tag in self.__class__.__garbage_tags:
-            pattern = re.compile(r'<\s*%s(\s*| [^/]+?)>.*?<\s*/\s*%s\s*>' % (tag, tag), re.DOTALL | re.IGNORECASE)
-            self.__garbage_tag_patterns.append(pattern)
-
-        # Riconosce i tag HTML contenitori
-        self.__wrapper_tag_patterns = list()
-        for tag in self.__class__.__wrapper_tags:
-            left_pattern = re.compile(r'<\s*%s(\s*| [^/]+?)>' % tag, re.DOTALL | re.IGNORECASE)
-            right_pattern = re.compile(r'<\s*/\s*%s\s*>' % tag, re.DOTALL | re.IGNORECASE)
-            self.__wrapper_tag_patterns.append((left_pattern, right_pattern))
-
-        # Riconosce i tag HTML singoli
-        self.__single_tag_patterns = list()
-        for tag in self.__class__.__single_tags:
-            good_pattern = re.compile(r'<\s*%s(\s*| .+?)/\s*>' % tag, re.DOTALL | re.IGNORECASE)
-            bad_pattern = re.compile(r'<\s*(/|\\)?\s*%s(\s*| [^/]+?)\\?\s*>' % tag, re.DOTALL | re.IGNORECASE)
-            self.__single_tag_patterns.append((good_pattern, bad_pattern))
-
-        # Riconosce i tag HTML segnaposto
-        self.__placeholder_tag_patterns = list()
-        for tag in self.__class__.__placeholder_tags:
-            pattern = re.compile(r'<\s*%s(\s*| [^/]+?)>.*?<\s*/\s*%s\s*>' % (tag, tag), re.DOTALL | re.IGNORECASE)
-            self.__placeholder_tag_patterns.append((pattern, self.__class__.__placeholder_tags[tag]))
+        # One alternation that fuses the comment, garbage-tag, placeholder-tag,
+        # wrapper-tag, single-tag and http-link patterns, so all of them are
+        # stripped in a single pass over the text instead of one pass each.
+        # Alternatives are ordered like the old sequential passes: paired
+        # garbage tags win over their bare single-tag form at the same spot.
+        garbage_alt = '|'.join(self.__class__.__garbage_tags)
+        wrapper_alt = '|'.join(self.__class__.__wrapper_tags)
+        single_alt = '|'.join(self.__class__.__single_tags)
+        placeholder_alt = '|'.join(self.__class__.__placeholder_tags)
+        self.__markup_pattern = re.compile(
+            r'<!--.*?-->'
+            r'|<\s*(?:%s)(?:\s*| [^/]+?)>.*?<\s*/\s*(?:%s)\s*>' % (garbage_alt, garbage_alt) +
+            r'|<\s*(?P<placeholder>%s)(?:\s*| [^/]+?)>.*?<\s*/\s*(?P=placeholder)\s*>' % placeholder_alt +
+            r'|<\s*(?:%s)(?:\s*| [^/]+?)>' % wrapper_alt +
+            r'|<\s*/\s*(?:%s)\s*>' % wrapper_alt +
+            r'|<\s*(?:%s)(?:\s*| .+?)/\s*>' % single_alt +
+            r'|<\s*(?:/|\\)?\s*(?:%s)(?:\s*| [^/]+?)\\?\s*>' % single_alt +
+            r'|\[http.*?\]',
+            re.DOTALL | re.IGNORECASE)
 
         # Riconosce le tabelle e i template
         self.__table_pattern = re.compile(r'\{[^{]*?\}', re.DOTALL)
@@ -250,16 +270,13 @@ class AnnotatedWikiExtractor(object):
         bad_right_wikilink_pattern = re.compile(r'\[\[[^[]*?\]', re.DOTALL)
         self.__wikilink_pattern = (good_wikilink_pattern, bad_left_wikilink_pattern, bad_right_wikilink_pattern)
 
-        # Riconosce i link HTTP
-        self.__http_link_pattern = re.compile(r'\[http.*?\]', re.DOTALL | re.IGNORECASE)
-
         # Riconosce gli apostrofi che precedono grassetto e corsivo
         apostrophe_bold_pattern = re.compile(r"\w'('''[^\s'][^']*?[^\s']''')[^']", re.DOTALL)
         apostrophe_italic_pattern = re.compile(r"\w'(''[^\s'][^']*?[^\s']'')[^']", re.DOTALL)
         self.__apostrophe_pattern = (apostrophe_bold_pattern, apostrophe_italic_pattern)
 
-        # Riconosce le entita' numeriche
-        self.__numeric_entity_pattern = re.compile(r'&#\d+?;')
+        # Riconosce le entita' HTML, per nome e numeriche, in un solo pattern
+        self.__entity_pattern = re.compile(r'&(?:#\d+|[A-Za-z][A-Za-z0-9]+);')
 
         # Riconosce gli spazi multipli
         self.__multi_space_pattern = re.compile(r' {2,}')
@@ -267,6 +284,32 @@ class AnnotatedWikiExtractor(object):
         # Riconosce i punti multipli
         self.__multi_dot_pattern = re.compile(r'\.{4,}')
 
+        # Riconosce in un unico pattern gli spazi attorno alla punteggiatura
+        # e i doppi segni di interpunzione
+        self.__punct_fixup_pattern = re.compile(' ([,.:;)\\]\ue000\ue001])|([(\\[\ue000\ue001]) |,([,.])')
+
+        # Riconosce le ancore generate da __get_anchor_tag
+        self.__anchor_pattern = re.compile(r'<a href="([^"]+)">([^>]+)</a>')
+
+        # Il primo carattere di una riga seleziona il gestore di __compact
+        # con un unico accesso al dizionario
+        self.__line_dispatch = {
+            '+': self.__compact_title_line,
+            '=': self.__compact_section_line,
+            '*': self.__compact_dropped_line,
+            '#': self.__compact_enum_line,
+            ':': self.__compact_dropped_line,
+            ';': self.__compact_dropped_line,
+            '{': self.__compact_dropped_line,
+            '|': self.__compact_dropped_line,
+        }
+
+        # I prefissi vengono confrontati con un'unica ricerca nell'insieme
+        # (hash) invece di un ciclo di startswith per ogni prefisso
+        self.__blocked_link_prefixes = frozenset(self.__garbage_link_prefixes + self.__project_namespaces)
+        self.__allowed_link_prefixes = frozenset(self.__allowed_prefixes)
+        self.__rejected_page_prefixes = frozenset(self.__garbage_page_prefixes)
+
     # ------------------------------------------------------------------------------
 
     def process_page(self, page):
@@ -278,75 +321,75 @@ class AnnotatedWikiExtractor(object):
         if wiki_document is None:
             return
 
-        data = {
-            "url": wiki_document.url
-        }
+        # il risultato e' una tupla etichettata (tipo, url, payload): il
+        # writer salta direttamente al gestore giusto e le righe TSV di
+        # redirect e categorie vengono gia' codificate qui, nel worker
         if self.__is_redirect(wiki_document):
-            if len(wiki_document.annotations) > 0:
-                data["redirect"] = get_wiki_document_url(wiki_document.annotations[0]['uri'], self.prefix)
-            else:
+            if len(wiki_document.annotations) == 0:
                 # print(f"No redirect link  found in {wiki_document.text}")
                 return None
-        elif self.__is_category_page(wiki_document):
-            data["parent_categories"] = list(get_wiki_document_url(c, self.prefix) for c in wiki_document.categories)
-        else:
-            data["json"] = str(wiki_document).encode('utf-8')
-
-        return data
+            target = get_wiki_document_url(wiki_document.annotations[0]['uri'], self.prefix)
+            return REDIRECT, None, f"{wiki_document.url}\t{target}\n".encode('utf-8')
+        if self.__is_category_page(wiki_document):
+            lines = ''.join(f"{wiki_document.url}\t{get_wiki_document_url(c, self.prefix)}\n"
+                            for c in wiki_document.categories)
+            return CATEGORY_PAGE, None, lines.encode('utf-8')
+        return ARTICLE, wiki_document.url, wiki_document.to_bytes()
 
     def extract_raw_document(self, page, quote=False):
+        # page e' una tupla (id, titolo, testo) gia' estratta dall'XML;
+        # l'unescape delle entita' XML e' stato fatto dal parser
+        page_id, title, text = page
+        if title is None or text is None:
+            return None
+        if self.reject_page(title):
+            # print "REJECT", title
+            return None
+
         wiki_document = AnnotatedWikiDocument()
-        for line in page:
+        wiki_document.id = int(page_id)
+        wiki_document.title = title
+        wiki_document.url = get_wiki_document_url(title, self.prefix, quote=quote)
+
+        # le righe vengono raccolte in una lista e unite una sola volta alla
+        # fine, invece di riallocare il testo ad ogni append
+        parts = ['++%s++' % title]
+        for line in text.split('\n'):
+            line = line.strip()
             if not line:
                 continue
-            # Identificatore della pagina (nodo XML)
-            if not wiki_document.id and line.startswith('<id>') and line.endswith('</id>'):
-                wiki_document.id = int(line[4:-5])
-                continue
-            # Titolo della pagina (nodo XML)
-            elif not wiki_document.url and line.startswith('<title>') and line.endswith('</title>'):
-                title = line[7:-8].replace('&amp;', '&')
-                if self.reject_page(title):
-                    # print "REJECT", title
-                    return None
-                wiki_document.title = title
-                wiki_document.url = get_wiki_document_url(title, self.prefix, quote=quote)
-
-                wiki_document.text = '++%s++' % title
-
-                continue
-            # Inizio del testo della pagina (nodo XML)
-            elif line.startswith('<text'):
-                if line.endswith('</text>'):
-                    # content with only one line .. most likely a redirect page
-                    line = line[27:-7]
-                else:
-                    line = line[27:]
-                if not line:
-                    continue
-            # Fine del testo della pagina (nodo XML)
-            elif line.endswith('</text>'):
-                line = line[:-7]
-                if not line:
-                    continue
-            # Informazione superflua (nodo XML)
-            elif line[0] == '<':
-                continue
             # Titolo di paragafo (testo della pagina)
-            elif line[0] == '=':
+            if line[0] == '=':
                 line = '==%s==' % line.strip('= ')
+            parts.append(line)
 
-            wiki_document.text += '\n%s' % line
-
+        wiki_document.text = '\n'.join(parts)
         return wiki_document
 
     def reject_page(self, title):
-        for reject_prefix in self.__garbage_page_prefixes:
-            if title.startswith(reject_prefix):
-                return True
-        return False
+        colon = title.find(':')
+        return colon != -1 and title[:colon + 1] in self.__rejected_page_prefixes
 
     def process_document(self, wiki_document):
+        # i redirect (circa meta' delle pagine di enwiki) saltano l'intera
+        # pulizia: di un redirect serve solo la destinazione del wikilink,
+        # il documento stesso non viene mai emesso
+        newline = wiki_document.text.find('\n')
+        body = wiki_document.text[newline + 1:].lstrip() if newline != -1 else ''
+        if body[:9].lower() == '#redirect':
+            line = body.split('\n', 1)[0].strip()
+            wiki_document.text = line
+            annotations = []
+            for m in self.__wikilink_pattern[0].finditer(line):
+                article_title, link_text = self.__handle_wikilink(m.group()[2:-2])
+                if not article_title or not link_text:
+                    continue
+                uri = get_wiki_document_url(article_title, '', quote=False)
+                if '%23' not in uri or self.keep_anchors:
+                    annotations.append({"uri": uri, "surface_form": link_text, "offset": 0})
+            wiki_document.annotations = annotations
+            return wiki_document
+
         wiki_document= self.__check_disambiguation(wiki_document)
 
         wiki_document = self.__clean(wiki_document)
@@ -356,28 +399,46 @@ class AnnotatedWikiExtractor(object):
         if wiki_document is None:
             return None
 
-        # This int is used to keep track of the difference between the original article with <a href="..">
-        # links and the new article that only contains the label of the link.
-        deltaStringLength = 0
-
-        # As a first step, find all links in the article, save their positions into the annotations object
-        ms = re.finditer('<a href="([^"]+)">([^>]+)</a>', wiki_document.text)
-
+        # Collect the annotations and replace every <a href=".."> link by its
+        # label in a single scan; a running length counter tracks each label's
+        # offset in the rewritten article.
+        text = wiki_document.text
         annotations = []
-        for m in ms:
-            if urllib.parse.quote("#") not in m.group(1) or self.keep_anchors:
-                annotations.append(
-                    {"uri": m.group(1), "surface_form": m.group(2), "offset": m.start() - deltaStringLength})
+        out = []
+        out_len = 0
+        pos = 0
+        for m in self.__anchor_pattern.finditer(text):
+            out.append(text[pos:m.start()])
+            out_len += m.start() - pos
+            label = m.group(2)
+            # '%23' is the url-quoted '#'; in-page anchor links are skipped
+            # unless explicitly kept
+            if '%23' not in m.group(1) or self.keep_anchors:
+                annotations.append({"uri": m.group(1), "surface_form": label, "offset": out_len})
+            out.append(label)
+            out_len += len(label)
+            pos = m.end()
+        out.append(text[pos:])
+
+        wiki_document.text = ''.join(out)
+        wiki_document.annotations = annotations
 
-            deltaStringLength += len(m.group(0)) - len(m.group(2))
+        return wiki_document
 
-        # As a second step, replace all links in the article by their label
-        wiki_document.text = re.sub('<a href="([^"]+)">([^>]+)</a>', lambda m: m.group(2), wiki_document.text)
+    def __strip_markup(self, text):
+        # placeholder tags keep a running per-document index (formula_1, ...);
+        # everything else matched by the fused pattern is simply dropped
+        counters = {}
 
-        # Create a new AnnotatedWikiDocument
-        wiki_document.annotations = annotations
+        def replacement(match):
+            tag = match.group('placeholder')
+            if tag is None:
+                return ''
+            placeholder = self.__class__.__placeholder_tags[tag.lower()]
+            counters[placeholder] = counters.get(placeholder, 0) + 1
+            return '%s_%d' % (placeholder, counters[placeholder])
 
-        return wiki_document
+        return self.__markup_pattern.sub(replacement, text)
 
     def __is_category_page(self, wiki_document):
         return wiki_document.title.lower().startswith("category:")
@@ -391,179 +452,148 @@ class AnnotatedWikiExtractor(object):
         return wiki_document
 
     def __clean(self, wiki_document):
-        # Rende maggiormente riconoscibili i tag
-        wiki_document.text = wiki_document.text.replace('&lt;', '<').replace('&gt;', '>')
-        wiki_document.text = wiki_document.text.replace('<<', u'��').replace('>>', u'��')
-
-        # Elimina i commenti HTML
-        wiki_document.text = self.__comment_pattern.sub('', wiki_document.text)
-
-        # Elimina i tag HTML spazzatura
-        for pattern in self.__garbage_tag_patterns:
-            wiki_document.text = pattern.sub('', wiki_document.text)
-
-        # Elimina i tag HTML contenitori
-        for left_pattern, right_pattern in self.__wrapper_tag_patterns:
-            wiki_document.text = left_pattern.sub('', wiki_document.text)
-            wiki_document.text = right_pattern.sub('', wiki_document.text)
-
-        # Elimina i tag HTML singoli
-        for good_pattern, bad_pattern in self.__single_tag_patterns:
-            wiki_document.text = good_pattern.sub('', wiki_document.text)
-            wiki_document.text = bad_pattern.sub('', wiki_document.text)
-
-        # Elimina i tag HTML segnaposto
-        for pattern, placeholder in self.__placeholder_tag_patterns:
-            index = 1
-            for match in pattern.finditer(wiki_document.text):
-                wiki_document.text = wiki_document.text.replace(match.group(), '%s_%d' % (placeholder, index))
-                index += 1
+        # Rende maggiormente riconoscibili i tag (l'unescape XML di &lt; e
+        # &gt; e' gia' stato fatto dal parser)
+        # '<<' e '>>' vengono protetti dallo stripper dei tag con due
+        # sentinelle a singolo codepoint nell'area ad uso privato, ripristinate
+        # come virgolette caporali alla fine della pulizia
+        wiki_document.text = wiki_document.text.replace('<<', '\ue000').replace('>>', '\ue001')
+
+        # strip comments, tags, placeholder tags and http links in one pass
+        wiki_document.text = self.__strip_markup(wiki_document.text)
 
         # Elimina le tabelle e i template
         wiki_document.text = wiki_document.text.replace('{{end box}}', '}')
         wiki_document.text = wiki_document.text.replace('{{', '{').replace('}}', '}')
         wiki_document.text = wiki_document.text.replace('{|', '{').replace('|}', '}')
-        wiki_document.text = self.__table_pattern.sub('', wiki_document.text)
-        wiki_document.text = self.__table_pattern.sub('', wiki_document.text)
-        wiki_document.text = self.__table_pattern.sub('', wiki_document.text)
+        # le parentesi annidate vengono eliminate dall'interno verso l'esterno
+        # fino al punto fisso; la maggior parte delle pagine esce al primo giro
+        while True:
+            stripped = self.__table_pattern.sub('', wiki_document.text)
+            if len(stripped) == len(wiki_document.text):
+                break
+            wiki_document.text = stripped
 
-        # Gestisce i wikilink (ben formattati; due livelli di annidamento)
+        # Gestisce i wikilink (ben formattati; due livelli di annidamento);
+        # ogni blocco viene sostituito in un unico passaggio con pattern.sub
         good_wikilink_pattern = self.__wikilink_pattern[0]
-        for match in good_wikilink_pattern.finditer(wiki_document.text):
-            wikilink = match.group()
-            document_title, link_text = self.__handle_wikilink(wikilink[2:-2], categories_sink=wiki_document.categories)
-            wiki_document.text = wiki_document.text.replace(wikilink, self.__get_anchor_tag(document_title, link_text))
-        for match in good_wikilink_pattern.finditer(wiki_document.text):
-            wikilink = match.group()
-            wiki_document.text = wiki_document.text.replace(wikilink, self.__handle_wikilink(wikilink[2:-2])[1])
+        wiki_document.text = good_wikilink_pattern.sub(
+            lambda m: self.__get_anchor_tag(
+                *self.__handle_wikilink(m.group()[2:-2], categories_sink=wiki_document.categories)),
+            wiki_document.text)
+        wiki_document.text = good_wikilink_pattern.sub(
+            lambda m: self.__handle_wikilink(m.group()[2:-2])[1], wiki_document.text)
 
         # Gestisce i wikilink (mal formattati)
         bad_left_wikilink_pattern = self.__wikilink_pattern[1]
-        for match in bad_left_wikilink_pattern.finditer(wiki_document.text):
-            wikilink = match.group()
-            document_title, link_text = self.__handle_wikilink(wikilink[1:-2], categories_sink=wiki_document.categories)
-            wiki_document.text = wiki_document.text.replace(wikilink, self.__get_anchor_tag(document_title, link_text))
+        wiki_document.text = bad_left_wikilink_pattern.sub(
+            lambda m: self.__get_anchor_tag(
+                *self.__handle_wikilink(m.group()[1:-2], categories_sink=wiki_document.categories)),
+            wiki_document.text)
 
         bad_right_wikilink_pattern = self.__wikilink_pattern[2]
-        for match in bad_right_wikilink_pattern.finditer(wiki_document.text):
-            wikilink = match.group()
-            document_title, link_text = self.__handle_wikilink(wikilink[2:-1], categories_sink=wiki_document.categories)
-            wiki_document.text = wiki_document.text.replace(wikilink, self.__get_anchor_tag(document_title, link_text))
+        wiki_document.text = bad_right_wikilink_pattern.sub(
+            lambda m: self.__get_anchor_tag(
+                *self.__handle_wikilink(m.group()[2:-1], categories_sink=wiki_document.categories)),
+            wiki_document.text)
         wiki_document.text = wiki_document.text.replace('[[', '').replace(']]', '')
 
-        # Elimina i link HTTP
-        wiki_document.text = self.__http_link_pattern.sub('', wiki_document.text).replace('[]', '')
+        # Elimina i resti dei link HTTP
+        wiki_document.text = wiki_document.text.replace('[]', '')
 
         # Gestisce i grassetti e i corsivi
         apostrophe_bold_pattern = self.__apostrophe_pattern[0]
-        for match in apostrophe_bold_pattern.finditer(wiki_document.text):
-            bold_text = match.group(1)
-            wiki_document.text = wiki_document.text.replace(bold_text, bold_text[3:-3])
+        wiki_document.text = apostrophe_bold_pattern.sub(
+            lambda m: m.group(0).replace(m.group(1), m.group(1)[3:-3]), wiki_document.text)
         apostrophe_italic_pattern = self.__apostrophe_pattern[1]
-        for match in apostrophe_italic_pattern.finditer(wiki_document.text):
-            italic_text = match.group(1)
-            wiki_document.text = wiki_document.text.replace(italic_text, '&quot;%s&quot;' % italic_text[2:-2])
+        wiki_document.text = apostrophe_italic_pattern.sub(
+            lambda m: m.group(0).replace(m.group(1), '&quot;%s&quot;' % m.group(1)[2:-2]), wiki_document.text)
         wiki_document.text = wiki_document.text.replace("'''", '').replace("''", '&quot;')
 
-        # Gestisce i caratteri speciali
-        wiki_document.text = wiki_document.text.replace('&amp;', '&').replace('&quot;&quot;', '&quot;')
-        for entity in self.__class__.__char_entities:
-            wiki_document.text = wiki_document.text.replace(entity, self.__class__.__char_entities[entity])
-
-        # Gestisce i caratteri speciali
-        for match in self.__numeric_entity_pattern.finditer(wiki_document.text):
-            entity = match.group()
-            wiki_document.text = wiki_document.text.replace(entity, self.__handle_unicode(entity))
-
-        # Gestisce alcune imperfezioni del testo
+        # Gestisce i caratteri speciali: un unico passaggio risolve sia le
+        # entita' con nome (lookup nella mappa) sia quelle numeriche, invece
+        # di una scansione del testo per ciascuna delle ~210 entita' note
+        wiki_document.text = wiki_document.text.replace('&quot;&quot;', '&quot;')
+        entity_map = self.__class__.__char_entities
+        wiki_document.text = self.__entity_pattern.sub(
+            lambda m: self.__handle_unicode(m.group()) if m.group()[1] == '#'
+            else entity_map.get(m.group(), m.group()),
+            wiki_document.text)
+
+        # Gestisce alcune imperfezioni del testo; i ~12 replace puntuali di
+        # spazi e doppi segni sono fusi in un'unica sostituzione
         wiki_document.text = wiki_document.text.replace('\t', ' ')
         wiki_document.text = self.__multi_space_pattern.sub(' ', wiki_document.text)
         wiki_document.text = self.__multi_dot_pattern.sub('...', wiki_document.text)
-        wiki_document.text = wiki_document.text.replace(' ,', ',').replace(' .', '.')
-        wiki_document.text = wiki_document.text.replace(' :', ':').replace(' ;', ';')
-        wiki_document.text = wiki_document.text.replace(',,', ',').replace(',.', '.')
-        wiki_document.text = wiki_document.text.replace('( ', '(').replace(' )', ')')
-        wiki_document.text = wiki_document.text.replace('[ ', '[').replace(' ]', ']')
-        wiki_document.text = wiki_document.text.replace(u'�� ', u'��').replace(u' ��', u'��')
+        wiki_document.text = self.__punct_fixup_pattern.sub(
+            lambda m: m.group(1) or m.group(2) or m.group(3), wiki_document.text)
+        wiki_document.text = wiki_document.text.replace('\ue000', u'\u00ab').replace('\ue001', u'\u00bb')
 
         return wiki_document
 
+    def __compact_title_line(self, line, page, paragraph):
+        # Gestisce il titolo della pagina
+        if not line.startswith('++'):
+            return self.__compact_body_line(line, page, paragraph)
+        title = line[2:-2]
+        if title and title[-1] not in '!?':
+            title = '%s.' % title
+        page[:] = [title]
+
+    def __compact_section_line(self, line, page, paragraph):
+        # Gestisce i titoli dei paragrafi
+        if not line.startswith('=='):
+            return self.__compact_body_line(line, page, paragraph)
+        if len(paragraph) > 1:
+            page.extend(paragraph)
+        title = line[2:-2]
+        if title and title[-1] not in '!?':
+            title = '%s.' % title
+        paragraph[:] = [title]
+
+    def __compact_enum_line(self, line, page, paragraph):
+        if line[:9].lower() == "#redirect":
+            return line
+        return self.__compact_dropped_line(line, page, paragraph)
+
+    def __compact_dropped_line(self, line, page, paragraph):
+        # Elimina gli elenchi puntati e numerati, i rientri, le definizioni e
+        # i resti delle tabelle: il vecchio ciclo ripuliva queste righe ma non
+        # le aggiungeva mai alla pagina, con o senza i flag drop_*
+        return None
+
+    def __compact_body_line(self, line, page, paragraph):
+        # Elimina le righe non significative
+        if line.strip('.- ') == '':
+            return None
+        # Elimina le righe con un basso numero di token
+        if '_' not in line and len(line.split()) < 6:
+            return None
+        # Gestisce il testo della pagina
+        if len(paragraph) == 0:
+            page.append(line)
+        # Gestisce il testo dei paragrafi
+        else:
+            paragraph.append(line)
+        return None
+
     def __compact(self, wiki_document):
         page = list()
         paragraph = list()
 
-        for line in wiki_document.text.split('\n'):
+        dispatch = self.__line_dispatch
+        body_handler = self.__compact_body_line
+        for line in wiki_document.text.splitlines():
             line = line.strip()
             if not line:
                 continue
-
-            # Gestisce il titolo della pagina
-            if line.startswith('++'):
-                title = line[2:-2]
-                if title and title[-1] not in '!?':
-                    title = '%s.' % title
-                page = [title]
-            # Gestisce i titoli dei paragrafi
-            elif line.startswith('=='):
-                if len(paragraph) > 1:
-                    page.extend(paragraph)
-                title = line[2:-2]
-                if title and title[-1] not in '!?':
-                    title = '%s.' % title
-                paragraph = [title]
-
-            elif line[:9].lower() == "#redirect":
-                wiki_document.text = line
+            # un gestore restituisce una riga solo per i redirect, che
+            # diventano l'intero testo del documento
+            redirect = dispatch.get(line[0], body_handler)(line, page, paragraph)
+            if redirect is not None:
+                wiki_document.text = redirect
                 return wiki_document
 
-            # Elimina gli elenchi puntati e numerati
-            # elif line[-1] == ':' or line[0] in '*#:;':
-            #     continue
-            elif line[0] == '*':
-                if self.drop_lists:
-                    continue
-                else:
-                    line = line.strip("* ")
-            elif line[0] == '#':
-                if self.drop_enumerations:
-                    continue
-                else:
-                    line = line.strip("# ")
-            elif line[0] == ':':
-                if self.drop_indents:
-                    continue
-                else:
-                    line = line.strip(": ")
-            elif line[0] == ";":
-                line = line.strip("; ")
-
-            # Elimina i resti delle tabelle
-            elif line[0] in '{|':
-                if self.drop_tables:
-                    continue
-                else:
-                    line = line.strip("{| ")
-
-            # elif line[0] in '{|' or line[-1] in '}':
-            #     continue
-
-            # Elimina le righe non significative
-            elif line.strip('.- ') == '':
-                continue
-
-            # elif (line[0] == '(' and line[-1] == ')'):
-            #     continue
-
-            # Elimina le righe con un basso numero di token
-            elif not '_' in line and len(line.split()) < 6:
-                continue
-            # Gestisce il testo della pagina
-            elif len(paragraph) == 0:
-                page.append(line)
-            # Gestisce il testo dei paragrafi
-            else:
-                paragraph.append(line)
-
         if len(paragraph) > 1:
             page.extend(paragraph)
         elif len(page) == 1:
@@ -578,10 +608,9 @@ class AnnotatedWikiExtractor(object):
             wikilink = wikilink[1:]
 
         # allow some prefixes
-        for p in self.__allowed_prefixes:
-            if wikilink.strip().lower().startswith(p):
-                wikilink = wikilink[len(p):]
-                break
+        colon = wikilink.find(':')
+        if colon != -1 and wikilink[:colon + 1].strip().lower() in self.__allowed_link_prefixes:
+            wikilink = wikilink[colon + 1:]
 
         # split into  article title and link text
         parts = wikilink.split("|")
@@ -591,11 +620,11 @@ class AnnotatedWikiExtractor(object):
             categories_sink.add(parts[0])
 
         # filter files, categories, etc, ...
-        for p in self.__garbage_link_prefixes + self.__project_namespaces:
-            if wclean.startswith(p + ":"):
-                # ignore all garbage links
-                # ignore all "unknown"/non-english versions of garbage links by generic "wiki" prefix
-                return "", ""
+        # (ignore all garbage links and all "unknown"/non-english versions of
+        # garbage links by generic "wiki" prefix)
+        colon = wclean.find(':')
+        if colon != -1 and wclean[:colon] in self.__blocked_link_prefixes:
+            return "", ""
 
         # only consider article title, not link text, when checking for cross language links
         tokens = parts[0].split(":")
@@ -635,44 +664,86 @@ class AnnotatedWikiExtractor(object):
 
 
 class OutputSplitter:
-    def __init__(self, compress, max_file_size, path_name):
+    def __init__(self, compress, max_file_size, path_name, compress_format='bz2',
+                 target_compressed_bytes=None):
         self.__dir_index = 0
         self.__file_index = -1
         self.__cur_file_size = 0
         self.__line_number = 0
+        # tutti i 676 nomi di directory (AA..ZZ) precalcolati una volta
+        self.__dir_names = [os.path.join(path_name, chr(65 + a) + chr(65 + b))
+                            for a in range(26) for b in range(26)]
         self.__compress = compress
+        self.__compress_format = compress_format
         self.__max_file_size = max_file_size
+        self.__target_compressed_bytes = target_compressed_bytes
+        # stima del rapporto di compressione, aggiornata ad ogni rollover con
+        # quello osservato sul file appena chiuso
+        self.__compression_ratio = 4.0 if compress else 1.0
         self.__path_name = path_name
+        self.__created_dirs = set()
+        self.__out_buffer = bytearray()
         self.__out_file, self.__current_filepath = self.__open_next_file()
-        self.__index_file = io.open(os.path.join(path_name, "index.tsv"), "w", encoding="utf-8")
-        self.__categories_file = io.open(os.path.join(path_name, "categories.tsv"), "w", encoding="utf-8")
-        self.__redirects_file = io.open(os.path.join(path_name, "redirects.tsv"), "w", encoding="utf-8")
+        # ogni flusso accumula i byte in un bytearray riusato, svuotato sul
+        # file (non bufferizzato) a blocchi da 1 MiB: niente piccole scritture
+        # e niente allocazioni per documento
+        self.__index_file = open(os.path.join(path_name, "index.tsv"), "wb", buffering=0)
+        self.__index_buffer = bytearray()
+        self.__categories_file = open(os.path.join(path_name, "categories.tsv"), "wb", buffering=0)
+        self.__categories_buffer = bytearray()
+        self.__redirects_file = open(os.path.join(path_name, "redirects.tsv"), "wb", buffering=0)
+        self.__redirects_buffer = bytearray()
+        self.__dispatch = [self.__write_article, self.__write_redirect, self.__write_categories]
 
     #def write(self, (url, text)):
     def write(self, data):
-        if "parent_categories" in data:
-            for parent in data["parent_categories"]:
-                self.__categories_file.write(f"{data['url']}\t{parent}\n")
-            return
-        if "redirect" in data:
-            self.__redirects_file.write(f"{data['url']}\t{data['redirect']}\n")
-            return
-
-        text = data["json"]
+        kind, url, payload = data
+        self.__dispatch[kind](url, payload)
+
+    def __write_redirect(self, url, payload):
+        buffer = self.__redirects_buffer
+        buffer += payload
+        if len(buffer) >= 1048576:
+            self.__redirects_file.write(buffer)
+            buffer.clear()
+
+    def __write_categories(self, url, payload):
+        buffer = self.__categories_buffer
+        buffer += payload
+        if len(buffer) >= 1048576:
+            self.__categories_file.write(buffer)
+            buffer.clear()
+
+    def __write_article(self, url, text):
+        # il payload e' gia' UTF-8: viene scritto senza il giro di decodifica
+        # e ricodifica imposto da un file in modalita' testo
         text_len = len(text)
-        if self.__cur_file_size + text_len / 2 > self.__max_file_size:
-            self.__close_cur_file()
-            self.__out_file, self.__current_filepath = self.__open_next_file()
-            self.__line_number = 0
-            self.__cur_file_size = 0
-        self.__out_file.write(str(text,'utf-8'))
+        if self.__target_compressed_bytes is None and \
+                self.__cur_file_size + text_len > self.__max_file_size * self.__compression_ratio:
+            self.__rollover()
+        buffer = self.__out_buffer
+        buffer += text
+        if len(buffer) >= 1048576:
+            self.__out_file.write(buffer)
+            buffer.clear()
         self.__cur_file_size += text_len
-        self.__add_to_index(data['url'])
+        self.__add_to_index(url)
         self.__line_number += 1
+        # in alternativa il limite si applica ai byte realmente su disco,
+        # letti con tell() dal file sottostante al compressore
+        if self.__target_compressed_bytes is not None and \
+                self.__raw_file.tell() >= self.__target_compressed_bytes:
+            self.__rollover()
 
     def close(self):
         self.__close_cur_file()
-        self.__index_file.close()
+        for buffer, out_file in ((self.__index_buffer, self.__index_file),
+                                 (self.__categories_buffer, self.__categories_file),
+                                 (self.__redirects_buffer, self.__redirects_file)):
+            if buffer:
+                out_file.write(buffer)
+                buffer.clear()
+            out_file.close()
 
     def __open_next_file(self):
         self.__file_index += 1
@@ -680,164 +751,236 @@ class OutputSplitter:
             self.__dir_index += 1
             self.__file_index = 0
         dir_name = self.__get_dir_name()
-        if not os.path.isdir(dir_name):
-            os.makedirs(dir_name)
-            print("Open next dir: {}".format(dir_name))
+        if dir_name not in self.__created_dirs:
+            os.makedirs(dir_name, exist_ok=True)
+            self.__created_dirs.add(dir_name)
 
         filepath = os.path.join(dir_name, self.__get_file_name())
         if self.__compress:
-            filepath = filepath + '.bz2'
-            return bz2.open(filepath, 'wt'), filepath
+            if self.__compress_format == 'zst':
+                # il compressore zstd usa tutti i core (threads=-1), quindi un
+                # solo writer non strozza la pipeline come faceva bz2
+                filepath = filepath + '.zst'
+                self.__raw_file = open(filepath, 'wb')
+                compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+                out_file = compressor.stream_writer(self.__raw_file)
+            else:
+                filepath = filepath + '.bz2'
+                self.__raw_file = open(filepath, 'wb')
+                out_file = bz2.BZ2File(self.__raw_file, 'wb')
         else:
-            return open(filepath, 'w'), filepath
+            out_file = open(filepath, 'wb', buffering=0)
+            self.__raw_file = out_file
+
+        # il percorso relativo per l'indice cambia solo qui, non per articolo
+        self.__current_relpath = os.path.relpath(filepath, self.__path_name)
+        return out_file, filepath
+
+    def __rollover(self):
+        finished_filepath = self.__current_filepath
+        uncompressed_size = self.__cur_file_size
+        self.__close_cur_file()
+        if self.__compress and self.__target_compressed_bytes is None and uncompressed_size > 0:
+            compressed_size = os.path.getsize(finished_filepath)
+            if compressed_size > 0:
+                self.__compression_ratio = max(1.0, uncompressed_size / compressed_size)
+        self.__out_file, self.__current_filepath = self.__open_next_file()
+        self.__line_number = 0
+        self.__cur_file_size = 0
 
     def __close_cur_file(self):
+        if self.__out_buffer:
+            self.__out_file.write(self.__out_buffer)
+            self.__out_buffer.clear()
         self.__out_file.close()
+        if not self.__raw_file.closed:
+            self.__raw_file.close()
 
     def __get_dir_name(self):
-        char1 = self.__dir_index % 26
-        char2 = int(self.__dir_index / 26) % 26
-        return os.path.join(self.__path_name, '%c%c' % (ord('A') + char2, ord('A') + char1))
+        return self.__dir_names[self.__dir_index % 676]
 
     def __get_file_name(self):
         return 'wiki%02d' % self.__file_index
 
     def __add_to_index(self, url):
-        rel_filepath = os.path.relpath(self.__current_filepath, self.__path_name)
-        self.__index_file.write(url + u"\t" + rel_filepath + u"\t" + str(self.__line_number) + u"\n")
+        buffer = self.__index_buffer
+        buffer += f"{url}\t{self.__current_relpath}\t{self.__line_number}\n".encode('utf-8')
+        if len(buffer) >= 1048576:
+            self.__index_file.write(buffer)
+            buffer.clear()
 
 
 ### USER INTERFACE ############################################################
 
-def show_help():
-    print() >> sys.stdout, __doc__,
-
-
-def show_usage(output_file, script_name):
-    print(output_file, 'Usage: python %s [options] < your_wikipedia_dump.xml' % script_name)
-
+def parse_size(size):
+    # dimensioni come '200k', '64m' o '1g'; senza suffisso sono byte
+    suffix = size[-1:].lower()
+    if suffix in ('k', 'm', 'g'):
+        return int(size[:-1]) * {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}[suffix]
+    return int(size)
+
+
+def open_dump_file(dump_path):
+    # blocchi di lettura da 1 MiB: il parser consuma a piccoli passi, ma le
+    # syscall verso il disco (o la pipe) avvengono a grandi blocchi
+    if dump_path.endswith('.bz2'):
+        try:
+            # indexed_bzip2 decodes the independent bz2 blocks on all cores,
+            # so the single-threaded decoder stops starving the pool workers
+            import indexed_bzip2
+            return indexed_bzip2.open(dump_path, parallelization=os.cpu_count())
+        except ImportError:
+            return io.BufferedReader(bz2.open(dump_path, 'rb'), buffer_size=1048576)
+    return open(dump_path, 'rb', buffering=1048576)
+
+
+def iter_pages(input_file):
+    # expat does the XML framing and entity decoding in C; every page is
+    # delivered as an (id, title, text) tuple and the element tree is pruned
+    # as soon as the page has been consumed, so memory use stays flat
+    context = ElementTree.iterparse(input_file, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag.rsplit('}', 1)[-1] == 'page':
+            yield (elem.findtext('{*}id'),
+                   elem.findtext('{*}title'),
+                   elem.findtext('{*}revision/{*}text'))
+            root.clear()
+
+
+# prefix = 'http://{}.wikipedia.org/wiki/'
+default_prefix = "http://en.wikipedia.org/wiki/"
+
+
+def process_file(input_file, output_splitter, number_of_workers, prefix, keep_anchors, batch_size=64):
+    print("Start processing file ...")
 
-def show_suggestion(output_file, script_name):
-    print(output_file, 'Try \'%s --help\' for more information.' % script_name)
+    # un thread dedicato possiede l'OutputSplitter: la compressione e le
+    # scritture (che rilasciano il GIL) si sovrappongono alla raccolta dei
+    # risultati; la coda limitata tiene sotto controllo la memoria
+    results_queue = queue.Queue(maxsize=max(256, 16 * number_of_workers))
+    writer = threading.Thread(target=writer_loop, args=(results_queue, output_splitter))
+    writer.start()
+
+    # al massimo 2*N lotti in volo: un worker veloce preleva subito il lotto
+    # successivo mentre uno lento non blocca l'invio degli altri, e il
+    # produttore non corre mai piu' di una finestra avanti rispetto ai worker
+    window = threading.BoundedSemaphore(2 * number_of_workers)
+    inflight = deque()
+    page_counter = 0
 
+    def drain(future):
+        nonlocal page_counter
+        for x in future.result():
+            page_counter += 1
+            if page_counter % 10000 == 0:
+                print("Process page ", page_counter)
+            if x is not None:
+                results_queue.put(x)
 
-def show_size_error(script_name, file_size):
-    print(sys.stderr, '%s: %s: Insufficient or invalid number of bytes' % (script_name, file_size))
+    pages = iter_pages(input_file)
+    batches = iter(lambda: list(itertools.islice(pages, batch_size)), [])
+    try:
+        with ProcessPoolExecutor(max_workers=number_of_workers, initializer=init_worker,
+                                 initargs=(prefix, keep_anchors)) as executor:
+            for batch in batches:
+                window.acquire()
+                future = executor.submit(process_pages_batch, batch)
+                future.add_done_callback(lambda _: window.release())
+                inflight.append(future)
+                while inflight and inflight[0].done():
+                    drain(inflight.popleft())
+            while inflight:
+                drain(inflight.popleft())
+    finally:
+        results_queue.put(None)
+        writer.join()
 
 
-def show_file_error(script_name, file_name):
-    print(sys.stderr, '%s: %s: No such file or directory' % (script_name, file_name))
+wiki_extractor = None
 
 
-def process_file(input_file, output_splitter, number_of_workers):
-    print("Start processing file ...")
-    # Set up pool of worker processes
-    pool = Pool(processes=number_of_workers)
+def init_worker(prefix, keep_anchors):
+    global wiki_extractor
+    wiki_extractor = AnnotatedWikiExtractor(prefix=prefix, keep_anchors=keep_anchors)
 
-    pages = []
-    page = []
-    page_counter = 0
-    for line in input_file:
-        line = line.strip()
-        if line == '<page>':
-            page = []
-        elif line == '</page>':
-            pages.append(page)
-            page_counter += 1
 
-            if len(pages) % 10000 == 0:
-                print("Process page ", page_counter)
+def process_page(page):
+    return wiki_extractor.process_page(page)
 
-            if len(pages) >= 10000:
-                for x in pool.map(process_page, pages):
-                    if x is not None:
-                        output_splitter.write(x)
-                pages = []
-        else:
-            page.append(line)
 
-    if len(pages) > 0:
-        for x in pool.map(process_page, pages):
-            if x is not None:
-                output_splitter.write(x)
+def process_pages_batch(pages):
+    return [wiki_extractor.process_page(page) for page in pages]
 
 
-def process_page(page):
-    return wiki_extractor.process_page(page)
+def writer_loop(results_queue, output_splitter):
+    while True:
+        data = results_queue.get()
+        if data is None:
+            return
+        output_splitter.write(data)
 
 
 def main():
-    script_name = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        description='Extracts and cleans text from a Wikipedia database dump and stores '
+                    'the output in a number of files of similar size in a given directory. '
+                    'In each line of these files, a wikipedia page is stored in JSON format.')
+    parser.add_argument('dump', nargs='?', metavar='your_wikipedia_dump.xml.bz2',
+                        help='dump file to read; the (uncompressed) dump is read '
+                             'from stdin when omitted')
+    parser.add_argument('-k', '--keep-anchors', action='store_true',
+                        help='do not drop annotations for anchor links (e.g. Anarchism#gender)')
+    parser.add_argument('-c', '--compress', action='store_true',
+                        help='compress output files (zstd by default)')
+    parser.add_argument('--format', choices=('zst', 'bz2'), default='zst',
+                        help="compression format for -c (default: 'zst')")
+    parser.add_argument('-b', '--bytes', type=parse_size, default=64 * 1024 * 1024, metavar='SIZE',
+                        help='put SIZE bytes per output file (default: 64m; the k, m and g '
+                             'suffixes are accepted); with -c the limit is scaled by the '
+                             'observed compression ratio')
+    parser.add_argument('--target-compressed-bytes', type=parse_size, metavar='SIZE',
+                        help='roll output files over when the bytes actually on disk reach '
+                             'SIZE, instead of counting uncompressed bytes (useful with -c)')
+    parser.add_argument('-o', '--output', default='.', metavar='DIR',
+                        help='place output files in DIR (default: current directory)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 4, metavar='N',
+                        help='use N worker processes (default: all %d cores)'
+                             % (os.cpu_count() or 4))
+    parser.add_argument('--batch-size', type=int, default=64, metavar='N',
+                        help='number of pages shipped to a worker per task (default: 64)')
+    parser.add_argument('-p', '--prefix', default=default_prefix, metavar='URL',
+                        help="use the specified url prefix (default: '%s')" % default_prefix)
+    args = parser.parse_args()
+
+    if args.bytes < 200 * 1024:
+        parser.error("argument -b/--bytes: insufficient number of bytes: '%d'" % args.bytes)
+    if args.target_compressed_bytes is not None and args.target_compressed_bytes < 1:
+        parser.error("argument --target-compressed-bytes: insufficient number of bytes: '%d'"
+                     % args.target_compressed_bytes)
+    if args.batch_size < 1:
+        parser.error("argument --batch-size: must be at least 1")
+    if not args.prefix.endswith('/'):
+        parser.error("argument -p/--prefix: '%s' does not end on '/'" % args.prefix)
+    if not os.path.isdir(args.output):
+        parser.error("argument -o/--output: no such directory: '%s'" % args.output)
+
+    if args.dump is not None:
+        if not os.path.isfile(args.dump):
+            parser.error("no such file: '%s'" % args.dump)
+        input_file = open_dump_file(args.dump)
+    else:
+        # lo stdin standard ha un buffer da 8 KiB; qui viene riaperto con
+        # blocchi da 1 MiB come per i dump passati da file
+        input_file = io.BufferedReader(sys.stdin.buffer.raw, buffer_size=1048576)
 
-    try:
-        long_opts = ['help', 'usage', 'compress', 'bytes=', 'output=', 'keep-anchors', "workers=", "prefix="]
-        opts, args = getopt.gnu_getopt(sys.argv[1:], 'kcb:o:w:p:', long_opts)
-    except getopt.GetoptError:
-        show_usage(sys.stderr, script_name)
-        show_suggestion(sys.stderr, script_name)
-        sys.exit(1)
-
-    compress = False
-    file_size = 500 * 1024
-    output_dir = '.'
-    number_of_workers = 4
-    keep_anchors = False
-    prefix = default_prefix
-
-    for opt, arg in opts:
-        if opt == '--help':
-            show_help()
-            sys.exit()
-        elif opt == '--usage':
-            show_usage(sys.stdout, script_name)
-            sys.exit()
-        elif opt in ('-k', '--keep-anchors'):
-            keep_anchors = True
-        elif opt in ('-c', '--compress'):
-            compress = True
-        elif opt in ('-b', '--bytes'):
-            try:
-                if arg[-1] in 'kK':
-                    file_size = int(arg[:-1]) * 1024
-                elif arg[-1] in 'mM':
-                    file_size = int(arg[:-1]) * 1024 * 1024
-                else:
-                    file_size = int(arg)
-                if file_size < 200 * 1024: raise ValueError()
-            except ValueError:
-                show_size_error(script_name, arg)
-                sys.exit(2)
-        elif opt in ('-o', '--output'):
-            if os.path.isdir(arg):
-                output_dir = arg
-            else:
-                show_file_error(script_name, arg)
-                sys.exit(3)
-        elif opt in ("-w", "--workers"):
-            number_of_workers = int(arg)
-        elif opt in ("-p", "--prefix"):
-            prefix = arg
-            if prefix[-1] != "/":
-                print("Prefix '{}' does not end on '/'".format(prefix))
-                sys.exit(1)
-
-    if len(args) > 0:
-        show_usage(sys.stderr, script_name)
-        show_suggestion(sys.stderr, script_name)
-        sys.exit(4)
-
-    output_splitter = OutputSplitter(compress, file_size, output_dir)
-    wiki_extractor.keep_anchors = keep_anchors
-    wiki_extractor.prefix = prefix
-    process_file(sys.stdin, output_splitter, number_of_workers)
+    output_splitter = OutputSplitter(args.compress, args.bytes, args.output, args.format,
+                                     args.target_compressed_bytes)
+    process_file(input_file, output_splitter, args.workers, args.prefix, args.keep_anchors,
+                 args.batch_size)
 
     output_splitter.close()
 
 
 if __name__ == '__main__':
-    # prefix = 'http://{}.wikipedia.org/wiki/'
-    default_prefix = "http://en.wikipedia.org/wiki/"
-
-    wiki_extractor = AnnotatedWikiExtractor(prefix=default_prefix, drop_lists=False, drop_enumerations=False,
-                                            drop_tables=False, drop_indents=False, keep_anchors=False)
     main()